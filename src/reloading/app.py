@@ -1,31 +1,83 @@
+import gzip
 import json
 import os
 from decimal import Decimal
 
+import click
+import numpy as np
 import pandas as pd
 import plotly
-import plotly.express as px
-from flask import Flask, flash, redirect, render_template, request, url_for
+from flask import (
+    Flask,
+    flash,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
 from sqlalchemy import String, asc, cast, desc, func, or_
-
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.schema import CreateIndex
+
+from charts import (
+    chart_payload,
+    chart_templates_js,
+    load_performance_scatter,
+    velocity_scatter,
+)
+from compression import brotli, compress_response
 from database import (
     Bullet,
     Cartridge,
     Firearm,
     Load,
+    LoadTemperatureStats,
     Powder,
     Shot,
     TestResult,
     TestSession,
     db,
 )
+from ladder import MIN_RANKED_SHOTS, fetch_shots, firearm_ladder_analysis
+from temperature import (
+    pooled_slope,
+    powder_temperature_model,
+    recompute_load_stats,
+    refit_temperature_stats,
+)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "reloading_secret_key")
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+if os.environ.get("DB_POOL_SIZE"):
+    # Only pooled dialects accept pool_size (SQLite's default pool does not).
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": int(os.environ["DB_POOL_SIZE"]),
+    }
 db.init_app(app)
 
 
+@app.after_request
+def compress(response):
+    return compress_response(response, request.headers.get("Accept-Encoding"))
+
+
+# --- SHARED CHART TEMPLATE ---
+@app.route("/charts/templates.js")
+def chart_templates():
+    response = make_response(chart_templates_js())
+    response.mimetype = "application/javascript"
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
+
+
+# Rows in the dashboard's "Recent Sessions Results" table.
+RECENT_RESULTS = 50
+
+
 @app.route("/")
 def index():
     # Filtering Logic
@@ -60,24 +112,11 @@ def index():
     if p_id and p_id != "":
         query = query.filter(Load.powder_id == p_id)
 
-    df = pd.read_sql(query.statement, db.engine)
+    df = pd.read_sql_query(query.statement, db.engine)
 
     chart_json = None
     if not df.empty:
-        fig = px.scatter(
-            df,
-            x="powder_weight_grains",
-            y="velocity_fps",
-            color="firearm_name",
-            hover_data=["bullet_name"],
-            title="Charge Weight vs Velocity",
-            labels={
-                "powder_weight_grains": "Powder Charge (gr)",
-                "velocity_fps": "Velocity (fps)",
-            },
-            template="plotly_white",
-        )
-        chart_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        chart_json = chart_payload(velocity_scatter(df))
 
     firearms = Firearm.query.all()
     bullets = Bullet.query.all()
@@ -97,6 +136,9 @@ def index():
         .join(Firearm, TestSession.firearm_id == Firearm.firearm_id)
         .join(Load, TestResult.load_id == Load.load_id)
         .join(Bullet, Load.bullet_id == Bullet.bullet_id)
+        .join(Powder, Load.powder_id == Powder.powder_id)
+        .order_by(TestSession.test_date.desc(), TestResult.result_id.desc())
+        .limit(RECENT_RESULTS)
         .all()
     )
 
@@ -110,6 +152,16 @@ def index():
     )
 
 
+def _results_with_sessions():
+    # Eager-load what the detail pages render for each result so the
+    # templates never trigger a query per row.
+    return (
+        selectinload(Load.test_results)
+        .joinedload(TestResult.test_session)
+        .joinedload(TestSession.firearm)
+    )
+
+
 # --- FIREARM LIST ---
 @app.route("/firearms")
 def list_firearms():
@@ -197,9 +249,6 @@ def delete_firearm(fid):
 def firearm_detail(fid):
     f = Firearm.query.get_or_404(fid)
 
-    full_bullet_name = func.concat(Bullet.manufacturer, " ", Bullet.model)
-    full_powder_name = func.concat(Powder.manufacturer, " ", Powder.name)
-
     # 1. Fetch Sessions for this Firearm
     sessions = (
         TestSession.query.filter_by(firearm_id=fid)
@@ -207,53 +256,26 @@ def firearm_detail(fid):
         .all()
     )
 
-    # 2. Analytics Query: Get all shots associated with this firearm
-    query = (
-        db.session.query(
-            Shot.velocity_fps,
-            Load.powder_weight_grains,
-            TestResult.group_size_moa,
-            full_bullet_name.label("bullet_name"),
-            full_powder_name.label("powder_name"),
-            (full_bullet_name + "<br>" + full_powder_name).label("full_name"),
-        )
-        .select_from(TestResult)
-        .join(TestSession, TestResult.session_id == TestSession.session_id)
-        .join(Firearm, TestSession.firearm_id == Firearm.firearm_id)
-        .join(Load, TestResult.load_id == Load.load_id)
-        .join(Bullet, Load.bullet_id == Bullet.bullet_id)
-        .join(Shot, TestResult.result_id == Shot.result_id)
-        .join(Powder, Load.powder_id == Powder.powder_id)
-        .filter(Firearm.firearm_id == fid)
+    # 2. Analytics: every shot from this firearm, shared with the ladder analysis
+    shots = fetch_shots(fid)
+    df = pd.DataFrame.from_records(
+        shots, columns=shots[0]._fields if shots else None, coerce_float=True
     )
 
-    df = pd.read_sql(query.statement, db.engine)
-
     chart_json = None
     summary = {"best_moa": "N/A", "avg_fps": "N/A", "total_shots": 0}
 
     if not df.empty:
+        df["full_name"] = df["bullet_name"] + "<br>" + df["powder_name"]
+
         # Summary stats
         summary["best_moa"] = df["group_size_moa"].min()
         summary["avg_fps"] = round(df["velocity_fps"].mean(), 1)
         summary["total_shots"] = len(df)
 
         # Graph: Velocity Ladder for this specific rifle
-        fig = px.scatter(
-            df,
-            x="powder_weight_grains",
-            y="velocity_fps",
-            color="full_name",
-            title=f"Load Performance: {f.make} {f.model}",
-            labels={
-                "powder_weight_grains": "Charge (gr)",
-                "velocity_fps": "Velocity (fps)",
-                "full_name": "Load Name",
-            },
-            template="plotly_white",
-            trendline="ols",
-        )
-        chart_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        fig = load_performance_scatter(df, f"Load Performance: {f.make} {f.model}")
+        chart_json = chart_payload(fig)
 
     return render_template(
         "firearms/detail.html",
@@ -261,9 +283,18 @@ def firearm_detail(fid):
         sessions=sessions,
         chart_json=chart_json,
         summary=summary,
+        ladder=firearm_ladder_analysis(fid, shots),
+        min_ranked_shots=MIN_RANKED_SHOTS,
     )
 
 
+# --- FIREARM LOAD LADDER ANALYSIS (JSON) ---
+@app.route("/firearm/<int:fid>/ladder.json")
+def firearm_ladder_json(fid):
+    Firearm.query.get_or_404(fid)
+    return jsonify(firearm_ladder_analysis(fid))
+
+
 # --- BULLET LIST ---
 @app.route("/bullets")
 def list_bullets():
@@ -319,7 +350,7 @@ def add_bullet():
         db.session.commit()
         flash("Bullet added successfully!")
         return redirect(url_for("list_bullets"))
-    return render_template("bullets/form.html", firearm=None)
+    return render_template("bullets/form.html", bullet=None)
 
 
 # --- EDIT BULLET ---
@@ -354,7 +385,11 @@ def delete_bullet(bid):
 def bullet_detail(bid):
     b = Bullet.query.get_or_404(bid)
 
-    loads = Load.query.filter_by(bullet_id=bid).all()
+    loads = (
+        Load.query.filter_by(bullet_id=bid)
+        .options(joinedload(Load.powder), _results_with_sessions())
+        .all()
+    )
 
     results = []
     seen_firearm_ids = set()
@@ -462,14 +497,20 @@ def delete_powder(pid):
 @app.route("/powders/<int:pid>")
 def powder_detail(pid):
     powder = Powder.query.get_or_404(pid)
+    target_temp_f = request.args.get("temp_f", type=float)
 
     results = []
     seen_firearm_ids = set()
     firearms = []
     seen_session_ids = set()
     loads = []
+    powder_loads = (
+        Load.query.filter_by(powder_id=pid)
+        .options(joinedload(Load.bullet), _results_with_sessions())
+        .all()
+    )
 
-    for powder_load in powder.loads:
+    for powder_load in powder_loads:
         loads.append(powder_load)
         for r in powder_load.test_results:
             results.append(r)
@@ -489,6 +530,7 @@ def powder_detail(pid):
         results=results,
         firearms=firearms,
         session_ids=seen_session_ids,
+        temperature_model=powder_temperature_model(pid, target_temp_f),
     )
 
 
@@ -581,8 +623,13 @@ def cartridge_detail(cid):
     firearms = []
     seen_session_ids = set()
     loads = []
+    cartridge_loads = (
+        Load.query.filter_by(cartridge_id=cid)
+        .options(joinedload(Load.bullet), _results_with_sessions())
+        .all()
+    )
 
-    for cartridge_load in cartridge.loads:
+    for cartridge_load in cartridge_loads:
         loads.append(cartridge_load)
         for r in cartridge_load.test_results:
             results.append(r)
@@ -643,6 +690,96 @@ def format_numeric_caliber(val):
 
 app.jinja_env.filters["display_caliber"] = format_numeric_caliber
 
+
+# --- SCHEMA INDEXES ---
+@app.cli.command("create-indexes")
+def create_indexes():
+    # db.create_all() only indexes tables it creates, so existing databases
+    # pick up indexes added to the models (index=True) with this command.
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda i: i.name):
+                conn.execute(CreateIndex(index, if_not_exists=True))
+                click.echo(f"{index.name} on {table.name}")
+
+
+# --- TEMPERATURE MODEL REFIT ---
+@app.cli.command("refit-temperature")
+@click.option(
+    "--write/--check",
+    default=False,
+    help="Replace the incremental statistics with the refit (default: compare only).",
+)
+def refit_temperature(write):
+    refit = refit_temperature_stats()
+    current = {s.load_id: s for s in LoadTemperatureStats.query.all()}
+
+    powder_loads = {}
+    for load in Load.query.filter(Load.load_id.in_(set(refit) | set(current))):
+        powder_loads.setdefault(load.powder_id, []).append(load.load_id)
+
+    def fmt(slope):
+        return "n/a" if slope is None else f"{slope:+.3f}"
+
+    for powder_id, load_ids in powder_loads.items():
+        incremental = pooled_slope([current[i] for i in load_ids if i in current])
+        batch = pooled_slope([refit[i] for i in load_ids if i in refit])
+        click.echo(
+            f"powder {powder_id}: incremental {fmt(incremental)} fps/°F, "
+            f"refit {fmt(batch)} fps/°F"
+        )
+
+    if write:
+        recompute_load_stats(db.session.connection())
+        db.session.commit()
+        click.echo(f"Wrote temperature statistics for {len(refit)} loads.")
+
+
+# --- CHART PAYLOAD REPORT ---
+@app.cli.command("chart-payload-report")
+@click.option("--shots", default=5000, help="Shots in the synthetic dataset.")
+@click.option("--seed", default=0, help="Random seed for the dataset.")
+def chart_payload_report(shots, seed):
+    rng = np.random.default_rng(seed)
+    firearms = ["Tikka T3x", "Remington 700", "Bergara B14", "Savage 110"]
+    bullets = ["Hornady ELD-M", "Berger Hybrid", "Sierra MatchKing"]
+    powders = ["Hodgdon Varget", "Hodgdon H4350", "Alliant RL16"]
+    charge = rng.choice(np.arange(40.0, 44.0, 0.3), shots)
+    df = pd.DataFrame(
+        {
+            "powder_weight_grains": charge,
+            "velocity_fps": [
+                Decimal(f"{v:.2f}")
+                for v in 2500 + 55 * (charge - 40) + rng.normal(0, 12, shots)
+            ],
+            "firearm_name": rng.choice(firearms, shots),
+            "bullet_name": rng.choice(bullets, shots),
+            "powder_name": rng.choice(powders, shots),
+        }
+    )
+    df["full_name"] = df["bullet_name"] + "<br>" + df["powder_name"]
+
+    charts = {
+        "index": velocity_scatter(df),
+        "firearm_detail": load_performance_scatter(df, "Load Performance"),
+    }
+    click.echo(f"{'chart':<16}{'stage':<10}{'raw':>10}{'gzip':>10}{'br':>10}")
+    for name, fig in charts.items():
+        stages = {
+            "before": json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder),
+            "after": chart_payload(fig),
+        }
+        for stage, payload in stages.items():
+            body = payload.encode()
+            br = len(brotli.compress(body, quality=5)) if brotli else "n/a"
+            click.echo(
+                f"{name:<16}{stage:<10}{len(body):>10}"
+                f"{len(gzip.compress(body, compresslevel=6)):>10}{br:>10}"
+            )
+    template_js = len(chart_templates_js().encode())
+    click.echo(f"templates.js (cached once per browser): {template_js} bytes raw")
+
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
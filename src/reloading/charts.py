@@ -0,0 +1,135 @@
+import base64
+import json
+
+import numpy as np
+import plotly
+import plotly.express as px
+import plotly.io as pio
+
+# Chronographs report to 0.1 fps and scales to 0.01 gr; anything past that
+# is float noise that costs bytes on every point.
+MEASUREMENT_PRECISION = {"x": 2, "y": 1}
+CHART_TEMPLATE = "plotly_white"
+
+
+def velocity_scatter(df):
+    return px.scatter(
+        df,
+        x="powder_weight_grains",
+        y="velocity_fps",
+        color="firearm_name",
+        hover_data=["bullet_name"],
+        title="Charge Weight vs Velocity",
+        labels={
+            "powder_weight_grains": "Powder Charge (gr)",
+            "velocity_fps": "Velocity (fps)",
+        },
+        template=CHART_TEMPLATE,
+    )
+
+
+def load_performance_scatter(df, title):
+    return px.scatter(
+        df,
+        x="powder_weight_grains",
+        y="velocity_fps",
+        color="full_name",
+        title=title,
+        labels={
+            "powder_weight_grains": "Charge (gr)",
+            "velocity_fps": "Velocity (fps)",
+            "full_name": "Load Name",
+        },
+        template=CHART_TEMPLATE,
+        trendline="ols",
+    )
+
+
+def _typed_array(values, dtype):
+    data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    return {"dtype": dtype, "bdata": base64.b64encode(data.tobytes()).decode("ascii")}
+
+
+def _code_dtype(size):
+    return "u1" if size <= 0xFF else "u2" if size <= 0xFFFF else "u4"
+
+
+def _factor_customdata(traces):
+    # Replace per-point label strings with integer codes into one lookup
+    # list per column, shared by every trace on the chart.
+    columns = {}
+    for trace in traces:
+        data = trace.get("customdata")
+        if data is None:
+            continue
+        data = np.asarray(data, dtype=object)
+        if data.ndim == 1:
+            data = data[:, None]
+        trace["customdata"] = data
+        for j in range(data.shape[1]):
+            columns.setdefault(j, set()).update(data[:, j].tolist())
+
+    lookups = [sorted(columns[j], key=str) for j in sorted(columns)]
+    index = [{label: i for i, label in enumerate(labels)} for labels in lookups]
+    for trace in traces:
+        data = trace.pop("customdata", None)
+        if data is None:
+            continue
+        trace["customcodes"] = [
+            _typed_array(
+                [index[j][v] for v in data[:, j]], _code_dtype(len(lookups[j]))
+            )
+            for j in range(data.shape[1])
+        ]
+    return lookups
+
+
+def _trim_trace(trace, source):
+    x = np.round(np.asarray(source.x, dtype=float), MEASUREMENT_PRECISION["x"])
+    y = np.round(np.asarray(source.y, dtype=float), MEASUREMENT_PRECISION["y"])
+
+    # Fitted lines repeat the same point once per shot; one per charge will do.
+    if trace.get("mode") == "lines" and len(x) > 1:
+        keep = np.ones(len(x), dtype=bool)
+        keep[1:] = (np.diff(x) != 0) | (np.diff(y) != 0)
+        x, y = x[keep], y[keep]
+
+    trace["x"] = _typed_array(x, "f4")
+    trace["y"] = _typed_array(y, "f4")
+
+    # float32 cannot hold 0.1 exactly, so pin the hover format to the
+    # measurement precision instead of showing the raw value.
+    template = trace.get("hovertemplate")
+    if template:
+        for axis, digits in MEASUREMENT_PRECISION.items():
+            template = template.replace(f"%{{{axis}}}", f"%{{{axis}:.{digits}f}}")
+        trace["hovertemplate"] = template
+
+
+def chart_payload(fig):
+    figure = fig.to_plotly_json()
+    traces = figure["data"] = [dict(trace) for trace in figure["data"]]
+    for trace, source in zip(traces, fig.data):
+        if source.x is not None and source.y is not None:
+            _trim_trace(trace, source)
+        if source.customdata is not None:
+            trace["customdata"] = source.customdata
+
+    layout = dict(figure["layout"])
+    # The template is identical on every chart; it ships once via
+    # chart_templates.js and is referenced here by name.
+    layout["template"] = CHART_TEMPLATE
+    figure["layout"] = layout
+    figure["lookups"] = _factor_customdata(traces)
+
+    return json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder, separators=(",", ":"))
+
+
+def chart_templates_js():
+    template = pio.templates[CHART_TEMPLATE].to_plotly_json()
+    templates = json.dumps(
+        {CHART_TEMPLATE: template},
+        cls=plotly.utils.PlotlyJSONEncoder,
+        separators=(",", ":"),
+    )
+    return f"window.CHART_TEMPLATES = {templates};\n"
@@ -0,0 +1,75 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "text/css",
+    "text/html",
+    "text/javascript",
+}
+MIN_SIZE = 500
+
+
+def _parse_accept_encoding(accept_encoding):
+    # {coding: q}. An unparseable q counts as 0. Codings refused with q=0
+    # (in any spelling, e.g. "q=0.000") are kept so they can override "*".
+    offered = {}
+    for part in accept_encoding.split(","):
+        coding, *params = part.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        offered[coding] = q
+    return offered
+
+
+def _choose_encoding(accept_encoding):
+    offered = _parse_accept_encoding(accept_encoding)
+    # "*" stands for any coding that is not listed explicitly.
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    q = {c: offered.get(c, offered.get("*", 0.0)) for c in supported}
+    # Highest q wins; brotli breaks ties because it compresses HTML better.
+    candidates = [c for c in supported if q[c] > 0]
+    return max(candidates, key=q.get) if candidates else None
+
+
+def compress_response(response, accept_encoding):
+    if (
+        response.direct_passthrough
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = _choose_encoding(accept_encoding or "")
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_SIZE:
+        return response
+
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    else:
+        body = gzip.compress(body, compresslevel=6)
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -50,9 +50,11 @@ class Cartridge(db.Model):
 class Load(db.Model):
     __tablename__ = "loads"
     load_id = db.Column(db.Integer, primary_key=True)
-    cartridge_id = db.Column(db.Integer, db.ForeignKey("cartridges.cartridge_id"))
-    bullet_id = db.Column(db.Integer, db.ForeignKey("bullets.bullet_id"))
-    powder_id = db.Column(db.Integer, db.ForeignKey("powders.powder_id"))
+    cartridge_id = db.Column(
+        db.Integer, db.ForeignKey("cartridges.cartridge_id"), index=True
+    )
+    bullet_id = db.Column(db.Integer, db.ForeignKey("bullets.bullet_id"), index=True)
+    powder_id = db.Column(db.Integer, db.ForeignKey("powders.powder_id"), index=True)
     powder_weight_grains = db.Column(db.Float)
     primer_details = db.Column(db.String(100))
     case_details = db.Column(db.String(100))
@@ -61,13 +63,20 @@ class Load(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     notes = db.Column(db.Text)
     test_results = db.relationship("TestResult", backref="load", lazy=True)
+    temperature_stats = db.relationship(
+        "LoadTemperatureStats",
+        backref="load",
+        lazy=True,
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
 
 
 class TestSession(db.Model):
     __tablename__ = "test_sessions"
     session_id = db.Column(db.Integer, primary_key=True)
-    firearm_id = db.Column(db.Integer, db.ForeignKey("firearms.firearm_id"))
-    test_date = db.Column(db.DateTime)
+    firearm_id = db.Column(db.Integer, db.ForeignKey("firearms.firearm_id"), index=True)
+    test_date = db.Column(db.DateTime, index=True)
     location = db.Column(db.String(200))
     temperature_f = db.Column(db.Integer)
     density_altitude_ft = db.Column(db.Integer)
@@ -79,8 +88,10 @@ class TestSession(db.Model):
 class TestResult(db.Model):
     __tablename__ = "test_results"
     result_id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey("test_sessions.session_id"))
-    load_id = db.Column(db.Integer, db.ForeignKey("loads.load_id"))
+    session_id = db.Column(
+        db.Integer, db.ForeignKey("test_sessions.session_id"), index=True
+    )
+    load_id = db.Column(db.Integer, db.ForeignKey("loads.load_id"), index=True)
     range_yrd = db.Column(db.Integer)
     group_size_moa = db.Column(db.Numeric(5, 3))
     muzzle_velocity_avg = db.Column(db.Numeric(7, 2))
@@ -96,7 +107,26 @@ class TestResult(db.Model):
 class Shot(db.Model):
     __tablename__ = "shots"
     shot_id = db.Column(db.Integer, primary_key=True)
-    result_id = db.Column(db.Integer, db.ForeignKey("test_results.result_id"))
+    result_id = db.Column(
+        db.Integer, db.ForeignKey("test_results.result_id"), index=True
+    )
     shot_number = db.Column(db.Integer)
     velocity_fps = db.Column(db.Numeric(7, 2))
     trace_data = db.Column(JSONB)
+
+
+class LoadTemperatureStats(db.Model):
+    # Running sufficient statistics for velocity vs. session temperature,
+    # updated one shot at a time (Welford) so the fit never needs a full rescan.
+    __tablename__ = "load_temperature_stats"
+    load_id = db.Column(db.Integer, db.ForeignKey("loads.load_id"), primary_key=True)
+    n = db.Column(db.Integer, nullable=False, default=0)
+    mean_temp_f = db.Column(db.Float, nullable=False, default=0.0)
+    mean_velocity_fps = db.Column(db.Float, nullable=False, default=0.0)
+    m2_temp = db.Column(db.Float, nullable=False, default=0.0)
+    c_temp_velocity = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp(),
+        onupdate=db.func.current_timestamp(),
+    )
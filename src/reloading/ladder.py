@@ -0,0 +1,251 @@
+import threading
+
+import numpy as np
+from sqlalchemy import func
+
+from database import Bullet, Load, Powder, Shot, TestResult, TestSession, db
+
+# A charge step is a node when the velocity gain per grain drops below this
+# fraction of the ladder's overall gain per grain.
+NODE_FRACTION = 0.5
+BOOTSTRAP_SAMPLES = 1000
+# Upper bound on resampled values held in memory at once (~16 MB of floats).
+BOOTSTRAP_MAX_CELLS = 2_000_000
+CONFIDENCE = 0.95
+# Loads with fewer shots in multi-shot strings than this are listed but not
+# ranked: a couple of shots can land close together by luck.
+MIN_RANKED_SHOTS = 5
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def fetch_shots(fid):
+    # Every shot fired from this firearm with its load; shared by the detail
+    # page chart and the ladder analysis so the page reads the shots once.
+    full_bullet_name = func.concat(Bullet.manufacturer, " ", Bullet.model)
+    full_powder_name = func.concat(Powder.manufacturer, " ", Powder.name)
+    return (
+        db.session.query(
+            Load.load_id,
+            TestResult.result_id,
+            Load.bullet_id,
+            Load.powder_id,
+            Load.powder_weight_grains,
+            full_bullet_name.label("bullet_name"),
+            full_powder_name.label("powder_name"),
+            TestResult.group_size_moa,
+            Shot.velocity_fps,
+        )
+        .select_from(Shot)
+        .join(TestResult, Shot.result_id == TestResult.result_id)
+        .join(TestSession, TestResult.session_id == TestSession.session_id)
+        .join(Load, TestResult.load_id == Load.load_id)
+        .join(Bullet, Load.bullet_id == Bullet.bullet_id)
+        .join(Powder, Load.powder_id == Powder.powder_id)
+        .filter(TestSession.firearm_id == fid)
+        .order_by(Shot.shot_id)
+        .all()
+    )
+
+
+def _pooled_sd(samples, string_starts, string_counts, load_starts, dof):
+    # Per load: sqrt(sum of within-string squared deviations / sum of (n - 1)).
+    # Works on one set of shots or on a (samples, shots) matrix.
+    total = np.add.reduceat(samples, string_starts, axis=-1)
+    total_sq = np.add.reduceat(samples * samples, string_starts, axis=-1)
+    ss = np.clip(total_sq - total * total / string_counts, 0, None)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(np.add.reduceat(ss, load_starts, axis=-1) / dof)
+
+
+def _bootstrap_sd(velocities, string_starts, string_counts, load_starts, dof, rng):
+    # Resample shots within their own string, so day-to-day shifts between
+    # strings never enter the resampled SD. Each column of a (chunk, N)
+    # index matrix draws from the slice of `velocities` owned by its string;
+    # samples are drawn in chunks so memory stays bounded for large N.
+    owner = np.repeat(np.arange(len(string_counts)), string_counts)
+    owner_start = string_starts[owner]
+    owner_count = string_counts[owner]
+    chunk = max(1, min(BOOTSTRAP_SAMPLES, BOOTSTRAP_MAX_CELLS // len(velocities)))
+
+    sd = np.empty((BOOTSTRAP_SAMPLES, len(load_starts)))
+    for lo in range(0, BOOTSTRAP_SAMPLES, chunk):
+        hi = min(lo + chunk, BOOTSTRAP_SAMPLES)
+        u = rng.random((hi - lo, len(velocities)))
+        samples = velocities[owner_start + (u * owner_count).astype(np.intp)]
+        sd[lo:hi] = _pooled_sd(samples, string_starts, string_counts, load_starts, dof)
+
+    # Only the SD gets an interval: a resample can never exceed the observed
+    # ES, so a percentile bootstrap of the range is degenerate.
+    tail = (1 - CONFIDENCE) / 2 * 100
+    return np.percentile(sd, [tail, 100 - tail], axis=0)
+
+
+def analyze_shots(rows, seed=0):
+    rows = [
+        r
+        for r in rows
+        if r.velocity_fps is not None and r.powder_weight_grains is not None
+    ]
+    if not rows:
+        return {"loads": [], "ladders": []}
+
+    load_ids = np.array([r.load_id for r in rows])
+    result_ids = np.array([r.result_id for r in rows])
+    velocities = np.array([float(r.velocity_fps) for r in rows])
+
+    # A string is the shots of one test result. Sort by load, then string, so
+    # every string owns a contiguous slice of shots and every load a
+    # contiguous run of strings.
+    order = np.lexsort((result_ids, load_ids))
+    load_ids = load_ids[order]
+    result_ids = result_ids[order]
+    velocities = velocities[order]
+    new_string = np.ones(len(velocities), dtype=bool)
+    new_string[1:] = (np.diff(load_ids) != 0) | (np.diff(result_ids) != 0)
+    string_starts = np.flatnonzero(new_string)
+    string_counts = np.diff(np.append(string_starts, len(velocities)))
+    unique_ids, load_starts = np.unique(load_ids[string_starts], return_index=True)
+
+    info = {r.load_id: r for r in rows}
+    charges = np.array([float(info[i].powder_weight_grains) for i in unique_ids])
+    ladder_keys = [(info[i].bullet_id, info[i].powder_id) for i in unique_ids]
+    _, ladder_idx = np.unique(
+        np.array(ladder_keys, dtype=float), axis=0, return_inverse=True
+    )
+    ladder_idx = ladder_idx.ravel()
+
+    shots = np.add.reduceat(string_counts, load_starts)
+    strings = np.diff(np.append(load_starts, len(string_starts)))
+    mean = np.add.reduceat(velocities, string_starts[load_starts]) / shots
+
+    # SD and ES are within-string figures: pooling every session's shots
+    # would add the day-to-day and temperature shifts between strings.
+    dof = np.add.reduceat(string_counts - 1, load_starts)
+    sd = _pooled_sd(velocities, string_starts, string_counts, load_starts, dof)
+    multi = string_counts > 1
+    string_es = np.maximum.reduceat(velocities, string_starts) - np.minimum.reduceat(
+        velocities, string_starts
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        es = np.add.reduceat(np.where(multi, string_es, 0), load_starts) / (
+            np.add.reduceat(multi.astype(int), load_starts)
+        )
+
+    rng = np.random.default_rng(seed)
+    sd_ci = _bootstrap_sd(
+        velocities, string_starts, string_counts, load_starts, dof, rng
+    )
+    sd_ci[:, dof == 0] = np.nan
+
+    # Rank on the upper end of the SD interval, which penalises loads with
+    # few shots, then on SD and ES. Loads without enough shots come last.
+    ranked = np.add.reduceat(np.where(multi, string_counts, 0), load_starts) >= (
+        MIN_RANKED_SHOTS
+    )
+    rank_order = np.lexsort(
+        (
+            np.nan_to_num(es, nan=np.inf),
+            np.nan_to_num(sd, nan=np.inf),
+            np.nan_to_num(sd_ci[1], nan=np.inf),
+            ~ranked,
+        )
+    )
+
+    loads = []
+    for rank, i in enumerate(rank_order, start=1):
+        r = info[unique_ids[i]]
+        loads.append(
+            {
+                "load_id": int(unique_ids[i]),
+                "rank": rank if ranked[i] else None,
+                "ladder": f"{r.bullet_name} / {r.powder_name}",
+                "charge_grains": float(charges[i]),
+                "shots": int(shots[i]),
+                "strings": int(strings[i]),
+                "mean_fps": round(float(mean[i]), 1),
+                "sd_fps": _clean(sd[i]),
+                "es_fps": _clean(es[i]),
+                "sd_ci": [_clean(sd_ci[0, i]), _clean(sd_ci[1, i])],
+            }
+        )
+
+    ladders = _detect_nodes(ladder_idx, charges, mean, info, unique_ids)
+    return {"loads": loads, "ladders": ladders}
+
+
+def _detect_nodes(ladder_idx, charges, mean, info, unique_ids):
+    # Sort loads by (ladder, charge) and take slopes between neighbours;
+    # steps that cross a ladder boundary are masked out.
+    order = np.lexsort((charges, ladder_idx))
+    ladder = ladder_idx[order]
+    charge = charges[order]
+    velocity = mean[order]
+
+    same = ladder[1:] == ladder[:-1]
+    d_charge = np.diff(charge)
+    valid = same & (d_charge > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        step_slope = np.diff(velocity) / d_charge
+
+    n_ladders = int(ladder.max()) + 1
+    first = np.full(n_ladders, -1)
+    last = np.full(n_ladders, -1)
+    first[ladder[::-1]] = np.arange(len(ladder))[::-1]
+    last[ladder] = np.arange(len(ladder))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        overall = (velocity[last] - velocity[first]) / (charge[last] - charge[first])
+
+    is_node = valid & (step_slope < NODE_FRACTION * overall[ladder[:-1]])
+
+    ladders = []
+    for k in range(n_ladders):
+        if last[k] - first[k] < 2:
+            continue
+        r = info[unique_ids[order[first[k]]]]
+        steps = np.flatnonzero(is_node & (ladder[:-1] == k))
+        ladders.append(
+            {
+                "ladder": f"{r.bullet_name} / {r.powder_name}",
+                "loads": int(last[k] - first[k] + 1),
+                "fps_per_grain": _clean(overall[k]),
+                "nodes": [
+                    {
+                        "from_grains": float(charge[s]),
+                        "to_grains": float(charge[s + 1]),
+                        "center_grains": round(float(charge[s] + charge[s + 1]) / 2, 2),
+                        "fps_per_grain": _clean(step_slope[s]),
+                    }
+                    for s in steps
+                ],
+            }
+        )
+    return ladders
+
+
+def _clean(value):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else round(value, 1)
+
+
+def firearm_ladder_analysis(fid, rows=None):
+    # The analysis is cached against the exact shot data it was computed
+    # from, so any added, removed or edited shot or load invalidates it.
+    if rows is None:
+        rows = fetch_shots(fid)
+    key = hash(tuple(rows))
+    with _cache_lock:
+        cached = _cache.get(fid)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    analysis = analyze_shots(rows)
+    with _cache_lock:
+        _cache[fid] = (key, analysis)
+    return analysis
+
+
+def clear_ladder_cache():
+    with _cache_lock:
+        _cache.clear()
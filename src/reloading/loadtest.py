@@ -0,0 +1,201 @@
+"""Throughput scaling check for serve.py.
+
+Starts the production server with 1, 2, 4, ... workers, drives it with
+concurrent keep-alive connections and prints requests per second for each
+size.
+
+The load generator must not compete with the server for CPU, or adding
+workers only steals time from the clients. The available cores are split:
+the server (and every worker it forks) is pinned to one set, and a small,
+fixed pool of client processes to the other. Each client process runs
+several connections on threads, so the client count does not grow with the
+server size.
+
+    DATABASE_URL=postgresql:///reloading python loadtest.py --path /firearm/1
+"""
+
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import click
+
+SERVE = Path(__file__).with_name("serve.py")
+
+
+def _client(host, port, path, duration):
+    deadline = time.monotonic() + duration
+    ok = errors = 0
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    while time.monotonic() < deadline:
+        try:
+            conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+    conn.close()
+    return ok, errors
+
+
+def _client_process(host, port, path, duration, connections):
+    with ThreadPoolExecutor(connections) as pool:
+        futures = [
+            pool.submit(_client, host, port, path, duration) for _ in range(connections)
+        ]
+        results = [f.result() for f in futures]
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def _drive(pool, processes, host, port, path, duration, connections):
+    # Spread the connections as evenly as possible over the client processes.
+    shares = [
+        connections // processes + (i < connections % processes)
+        for i in range(processes)
+    ]
+    futures = [
+        pool.submit(_client_process, host, port, path, duration, share)
+        for share in shares
+        if share
+    ]
+    results = [f.result() for f in futures]
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def _split_cpus(client_cpus):
+    # Returns (server cpus, client cpus), or None when they cannot be separated.
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < 2:
+        return None
+    client_cpus = client_cpus or max(1, len(cpus) // 4)
+    client_cpus = min(client_cpus, len(cpus) - 1)
+    return set(cpus[client_cpus:]), set(cpus[:client_cpus])
+
+
+def _wait_for_port(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise click.ClickException(f"server did not start on {host}:{port}")
+
+
+def _worker_counts(maximum):
+    counts = []
+    n = 1
+    while n < maximum:
+        counts.append(n)
+        n *= 2
+    counts.append(maximum)
+    return counts
+
+
+@click.command()
+@click.option("--path", default="/", show_default=True, help="Route to request.")
+@click.option("--port", default=8765, show_default=True)
+@click.option("--threads", default=4, show_default=True, help="Threads per worker.")
+@click.option(
+    "--connections",
+    default=0,
+    help="Concurrent connections [2 x workers x threads].",
+)
+@click.option(
+    "--client-cpus",
+    default=0,
+    help="Cores reserved for the load generator [a quarter of the available].",
+)
+@click.option("--duration", default=10.0, show_default=True, help="Seconds per run.")
+@click.option(
+    "--max-workers", default=0, help="Largest server size [cores left to the server]."
+)
+def main(path, port, threads, connections, client_cpus, duration, max_workers):
+    host = "127.0.0.1"
+    split = _split_cpus(client_cpus)
+    if split is None:
+        click.echo(
+            "warning: cannot pin server and clients to separate cores; "
+            "they will compete for CPU and scaling will be understated",
+            err=True,
+        )
+        server_cpus, client_cpus = None, None
+        n_processes = 1
+        max_workers = max_workers or os.cpu_count() or 1
+    else:
+        server_cpus, client_cpus = split
+        n_processes = len(client_cpus)
+        max_workers = max_workers or len(server_cpus)
+        click.echo(
+            f"server cores {sorted(server_cpus)}, client cores {sorted(client_cpus)}"
+        )
+
+    def pool():
+        if client_cpus is None:
+            return ProcessPoolExecutor(n_processes)
+        return ProcessPoolExecutor(
+            n_processes, initializer=os.sched_setaffinity, initargs=(0, client_cpus)
+        )
+
+    click.echo(
+        f"{'workers':>8}{'connections':>13}{'req/s':>10}{'errors':>8}{'scaling':>9}"
+    )
+    baseline = None
+    with pool() as clients:
+        for workers in _worker_counts(max_workers):
+            n_connections = connections or 2 * workers * threads
+            server = subprocess.Popen(
+                [
+                    sys.executable,
+                    str(SERVE),
+                    "--bind",
+                    f"{host}:{port}",
+                    "--workers",
+                    str(workers),
+                    "--threads",
+                    str(threads),
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            if server_cpus is not None:
+                # Workers inherit the master's affinity; the master imports the
+                # app before forking, so this lands well before the first fork.
+                os.sched_setaffinity(server.pid, server_cpus)
+            try:
+                _wait_for_port(host, port)
+                # Untimed warm-up at full concurrency, so every worker thread
+                # has served requests before the measured run starts.
+                _drive(clients, n_processes, host, port, path, 1.0, n_connections)
+                ok, errors = _drive(
+                    clients, n_processes, host, port, path, duration, n_connections
+                )
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
+
+            rate = ok / duration
+            baseline = baseline or rate
+            click.echo(
+                f"{workers:>8}{n_connections:>13}{rate:>10.1f}{errors:>8}"
+                f"{rate / baseline if baseline else 0:>8.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
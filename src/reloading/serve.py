@@ -0,0 +1,116 @@
+"""Production server.
+
+Runs the app under gunicorn with ``preload_app``: pandas, plotly and the app
+itself are imported once in the master and shared copy-on-write by every
+forked worker. Each worker then warms its own database pool.
+
+    python serve.py --workers 4 --threads 8 --pid /tmp/reloading.pid
+
+Signals to the master (see --pid):
+
+- HUP: graceful reload of workers and configuration
+- USR2, then TERM to the old master: graceful reload of application code
+"""
+
+import logging
+import os
+import sys
+from pathlib import Path
+
+import click
+from gunicorn.app.base import BaseApplication
+from sqlalchemy.exc import SQLAlchemyError
+
+log = logging.getLogger("gunicorn.error")
+
+
+def warm_shared_state(app):
+    # Runs once in the master before forking, so the results are shared.
+    import statsmodels.api  # noqa: F401 - imported lazily by the OLS trendline
+
+    from charts import chart_templates_js
+
+    chart_templates_js()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+def warm_connection_pool(app, size):
+    from database import db
+
+    with app.app_context():
+        # Never reuse sockets inherited from the master across processes.
+        db.engine.dispose(close=False)
+        try:
+            connections = [db.engine.connect() for _ in range(size)]
+        except SQLAlchemyError as exc:
+            log.warning("Could not warm database pool: %s", exc)
+            return
+        for connection in connections:
+            connection.exec_driver_sql("SELECT 1")
+            connection.close()
+
+
+class ReloadingServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        sys.path.insert(0, str(Path(__file__).parent))
+        from app import app
+
+        warm_shared_state(app)
+        return app
+
+
+@click.command()
+@click.option(
+    "--bind",
+    default=lambda: f"0.0.0.0:{os.environ.get('PORT', '8000')}",
+    show_default="0.0.0.0:$PORT or 8000",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=lambda: int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    show_default="$WEB_CONCURRENCY or CPU count",
+)
+@click.option(
+    "--threads",
+    type=int,
+    default=lambda: int(os.environ.get("WEB_THREADS", "4")),
+    show_default="$WEB_THREADS or 4",
+    help="Request threads per worker; also the size of each worker's pool.",
+)
+@click.option("--timeout", type=int, default=30, show_default=True)
+@click.option("--graceful-timeout", type=int, default=30, show_default=True)
+@click.option("--pid", "pidfile", default=None, help="Write the master PID here.")
+def main(bind, workers, threads, timeout, graceful_timeout, pidfile):
+    # Must be set before the app is imported: the engine is built at import.
+    os.environ["DB_POOL_SIZE"] = str(threads)
+
+    def post_fork(server, worker):
+        warm_connection_pool(worker.app.wsgi(), threads)
+
+    ReloadingServer(
+        {
+            "bind": bind,
+            "workers": workers,
+            "threads": threads,
+            "worker_class": "gthread",
+            "preload_app": True,
+            "timeout": timeout,
+            "graceful_timeout": graceful_timeout,
+            "pidfile": pidfile,
+            "post_fork": post_fork,
+        }
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
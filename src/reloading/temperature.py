@@ -0,0 +1,358 @@
+from types import SimpleNamespace
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, joinedload
+
+from database import Load, LoadTemperatureStats, Shot, TestResult, TestSession, db
+
+# A load needs at least this much temperature variance (°F^2) across its
+# shots before its own slope is trusted; otherwise the powder slope is used.
+MIN_TEMP_VARIANCE = 4.0
+
+
+def new_stats(**kwargs):
+    values = {
+        "n": 0,
+        "mean_temp_f": 0.0,
+        "mean_velocity_fps": 0.0,
+        "m2_temp": 0.0,
+        "c_temp_velocity": 0.0,
+    }
+    values.update(kwargs)
+    return LoadTemperatureStats(**values)
+
+
+def add_observation(stats, temp_f, velocity_fps):
+    # Welford / co-moment update: O(1) per shot, numerically stable.
+    temp_f = float(temp_f)
+    velocity_fps = float(velocity_fps)
+    stats.n += 1
+    d_temp = temp_f - stats.mean_temp_f
+    stats.mean_temp_f += d_temp / stats.n
+    stats.mean_velocity_fps += (velocity_fps - stats.mean_velocity_fps) / stats.n
+    stats.m2_temp += d_temp * (temp_f - stats.mean_temp_f)
+    stats.c_temp_velocity += d_temp * (velocity_fps - stats.mean_velocity_fps)
+
+
+def load_slope(stats):
+    if stats is None or stats.n < 2 or stats.m2_temp / stats.n < MIN_TEMP_VARIANCE:
+        return None
+    return stats.c_temp_velocity / stats.m2_temp
+
+
+def pooled_slope(all_stats):
+    # Within-load estimator: each load keeps its own baseline velocity and
+    # only the temperature response is shared across the powder.
+    m2 = sum(s.m2_temp for s in all_stats)
+    cov = sum(s.c_temp_velocity for s in all_stats)
+    n = sum(s.n for s in all_stats)
+    if n < 2 or m2 / n < MIN_TEMP_VARIANCE:
+        return None
+    return cov / m2
+
+
+def predict_velocity(stats, target_temp_f, fallback_slope=None):
+    if stats is None or stats.n == 0:
+        return None
+    slope = load_slope(stats)
+    if slope is None:
+        slope = fallback_slope
+    if slope is None:
+        return None
+    return stats.mean_velocity_fps + slope * (target_temp_f - stats.mean_temp_f)
+
+
+def powder_temperature_model(pid, target_temp_f=None):
+    rows = (
+        db.session.query(LoadTemperatureStats, Load)
+        .join(Load, LoadTemperatureStats.load_id == Load.load_id)
+        .options(joinedload(Load.bullet))
+        .filter(Load.powder_id == pid)
+        .order_by(Load.powder_weight_grains)
+        .all()
+    )
+    powder_slope = pooled_slope([s for s, _ in rows])
+
+    loads = []
+    for stats, load in rows:
+        predicted = None
+        if target_temp_f is not None:
+            predicted = predict_velocity(stats, target_temp_f, powder_slope)
+        loads.append(
+            {
+                "load": load,
+                "shots": stats.n,
+                "mean_temp_f": stats.mean_temp_f,
+                "mean_velocity_fps": stats.mean_velocity_fps,
+                "fps_per_degree": load_slope(stats),
+                "predicted_fps": predicted,
+            }
+        )
+
+    return {
+        "fps_per_degree": powder_slope,
+        "target_temp_f": target_temp_f,
+        "loads": loads,
+    }
+
+
+# --- INCREMENTAL UPDATES ---
+# New shots are folded into per-load batches and merged into the stored
+# statistics with one atomic upsert, so concurrent writers never lose an
+# update. Anything that can invalidate existing statistics (deleted or
+# edited shots, moved results, edited session temperatures, bulk writes)
+# marks the affected loads dirty and they are recomputed from the database.
+_PENDING = "temperature_stats_pending"
+_STATS_COLUMNS = ["n", "mean_temp_f", "mean_velocity_fps", "m2_temp", "c_temp_velocity"]
+
+
+def _result_for(session, shot):
+    if shot.test_result is not None:
+        return shot.test_result
+    if shot.result_id is not None:
+        return session.get(TestResult, shot.result_id)
+    return None
+
+
+def _test_session_for(session, result):
+    if result.test_session is not None:
+        return result.test_session
+    if result.session_id is not None:
+        return session.get(TestSession, result.session_id)
+    return None
+
+
+def _load_for(session, result):
+    if result.load is not None:
+        return result.load
+    if result.load_id is not None:
+        return session.get(Load, result.load_id)
+    return None
+
+
+def _changed(obj, *attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+def _previous(obj, attr):
+    return [v for v in inspect(obj).attrs[attr].history.deleted if v is not None]
+
+
+def _queue_new_shot(session, pending, shot):
+    if shot.velocity_fps is None:
+        return
+    result = _result_for(session, shot)
+    if result is None:
+        return
+    test_session = _test_session_for(session, result)
+    if test_session is None or test_session.temperature_f is None:
+        return
+    load = _load_for(session, result)
+    if load is None:
+        return
+
+    batch = pending["batches"].get(id(load))
+    if batch is None:
+        batch = SimpleNamespace(n=0, **{c: 0.0 for c in _STATS_COLUMNS[1:]})
+        pending["batches"][id(load)] = (load, batch)
+    else:
+        batch = batch[1]
+    add_observation(batch, test_session.temperature_f, shot.velocity_fps)
+
+
+@event.listens_for(Session, "before_flush")
+def collect_temperature_changes(session, flush_context, instances):
+    session.info.pop(_PENDING, None)  # left over from a failed flush
+    pending = {"batches": {}, "loads": [], "results": [], "sessions": []}
+
+    for obj in session.new:
+        if isinstance(obj, Shot):
+            _queue_new_shot(session, pending, obj)
+
+    for obj in session.dirty:
+        if isinstance(obj, Shot) and _changed(
+            obj, "velocity_fps", "result_id", "test_result"
+        ):
+            pending["results"] += [obj.test_result or obj.result_id]
+            pending["results"] += _previous(obj, "result_id")
+            pending["results"] += _previous(obj, "test_result")
+        elif isinstance(obj, TestResult) and _changed(
+            obj, "load_id", "load", "session_id", "test_session"
+        ):
+            pending["results"].append(obj)
+            pending["loads"] += _previous(obj, "load_id") + _previous(obj, "load")
+        elif isinstance(obj, TestSession) and _changed(obj, "temperature_f"):
+            pending["sessions"].append(obj.session_id)
+
+    for obj in session.deleted:
+        if isinstance(obj, Shot):
+            pending["results"].append(obj.test_result or obj.result_id)
+        elif isinstance(obj, TestResult):
+            pending["loads"].append(obj.load or obj.load_id)
+        elif isinstance(obj, TestSession):
+            # The flush detaches its results (session_id -> NULL), so
+            # their shots stop counting towards their loads.
+            pending["results"] += obj.test_results
+        elif isinstance(obj, Load):
+            pending["loads"].append(obj.load_id)
+
+    if any(pending.values()):
+        session.info[_PENDING] = pending
+
+
+def _ids(values, attr):
+    return {getattr(v, attr) if hasattr(v, attr) else v for v in values} - {None}
+
+
+def _loads_touching(connection, column, ids):
+    if not ids:
+        return set()
+    rows = connection.execute(
+        select(TestResult.load_id).where(column.in_(ids)).distinct()
+    )
+    return {load_id for (load_id,) in rows} - {None}
+
+
+@event.listens_for(Session, "after_flush")
+def apply_temperature_changes(session, flush_context):
+    pending = session.info.pop(_PENDING, None)
+    if pending is None:
+        return
+    connection = session.connection()
+
+    dirty = _ids(pending["loads"], "load_id")
+    dirty |= _loads_touching(
+        connection, TestResult.result_id, _ids(pending["results"], "result_id")
+    )
+    dirty |= _loads_touching(
+        connection, TestResult.session_id, _ids(pending["sessions"], "session_id")
+    )
+
+    merges = [
+        {"load_id": load.load_id, **{c: getattr(batch, c) for c in _STATS_COLUMNS}}
+        for load, batch in pending["batches"].values()
+        if load.load_id not in dirty
+    ]
+    if merges:
+        connection.execute(_merge_statement(), merges)
+    if dirty:
+        recompute_load_stats(connection, dirty)
+
+
+def _merge_statement():
+    # Chan et al. parallel combination of the stored statistics with a
+    # batch; the right-hand sides see the row as it was before the update.
+    table = LoadTemperatureStats.__table__
+    stmt = pg_insert(table)
+    new = stmt.excluded
+    n = table.c.n + new.n
+    d_temp = new.mean_temp_f - table.c.mean_temp_f
+    d_velocity = new.mean_velocity_fps - table.c.mean_velocity_fps
+    weight = table.c.n * new.n / func.cast(n, db.Float)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.load_id],
+        set_={
+            "n": n,
+            "mean_temp_f": table.c.mean_temp_f + d_temp * new.n / n,
+            "mean_velocity_fps": table.c.mean_velocity_fps + d_velocity * new.n / n,
+            "m2_temp": table.c.m2_temp + new.m2_temp + d_temp * d_temp * weight,
+            "c_temp_velocity": table.c.c_temp_velocity
+            + new.c_temp_velocity
+            + d_temp * d_velocity * weight,
+            "updated_at": func.current_timestamp(),
+        },
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def track_bulk_writes(state):
+    # session.execute(insert(Shot), rows) and bulk UPDATE/DELETE bypass the
+    # flush, so recompute whatever loads they can have touched.
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    table = getattr(state.statement, "table", None)
+    tracked = {Shot.__tablename__, TestResult.__tablename__, TestSession.__tablename__}
+    if table is None or table.name not in tracked:
+        return None
+
+    load_ids = None
+    params = state.parameters
+    rows = params if isinstance(params, list) else [params] if params else []
+    if state.is_insert and table.name != Shot.__tablename__:
+        load_ids = set()  # new results and sessions have no shots yet
+    elif state.is_insert and rows and all("result_id" in row for row in rows):
+        load_ids = {row["result_id"] for row in rows}
+
+    result = state.invoke_statement()
+    connection = state.session.connection()
+    if load_ids is not None and state.is_insert and table.name == Shot.__tablename__:
+        load_ids = _loads_touching(connection, TestResult.result_id, load_ids)
+    if load_ids is None or load_ids:
+        recompute_load_stats(connection, load_ids)
+    return result
+
+
+# --- BATCH REFIT ---
+def _aggregate_select(load_ids=None):
+    n = func.count(Shot.velocity_fps)
+    query = (
+        select(
+            TestResult.load_id,
+            n,
+            func.avg(TestSession.temperature_f),
+            func.avg(Shot.velocity_fps),
+            func.var_pop(TestSession.temperature_f) * n,
+            func.covar_pop(TestSession.temperature_f, Shot.velocity_fps) * n,
+        )
+        .select_from(Shot)
+        .join(TestResult, Shot.result_id == TestResult.result_id)
+        .join(TestSession, TestResult.session_id == TestSession.session_id)
+        .where(
+            TestResult.load_id.isnot(None),
+            Shot.velocity_fps.isnot(None),
+            TestSession.temperature_f.isnot(None),
+        )
+        .group_by(TestResult.load_id)
+    )
+    if load_ids is not None:
+        query = query.where(TestResult.load_id.in_(load_ids))
+    return query
+
+
+def recompute_load_stats(connection, load_ids=None):
+    # The DELETE row-locks the existing statistics, so a concurrent merge for
+    # the same load waits for this transaction instead of being overwritten.
+    table = LoadTemperatureStats.__table__
+    delete = table.delete()
+    if load_ids is not None:
+        delete = delete.where(table.c.load_id.in_(load_ids))
+    connection.execute(delete)
+
+    stmt = pg_insert(table).from_select(
+        ["load_id", *_STATS_COLUMNS], _aggregate_select(load_ids)
+    )
+    connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.load_id],
+            set_={c: stmt.excluded[c] for c in _STATS_COLUMNS},
+        )
+    )
+
+
+def refit_temperature_stats():
+    # Recompute every load's statistics from scratch in one aggregate query.
+    refit = {}
+    for load_id, n, mean_temp, mean_velocity, m2, cov in db.session.execute(
+        _aggregate_select()
+    ):
+        refit[load_id] = new_stats(
+            load_id=load_id,
+            n=n,
+            mean_temp_f=float(mean_temp),
+            mean_velocity_fps=float(mean_velocity),
+            m2_temp=float(m2 or 0),
+            c_temp_velocity=float(cov or 0),
+        )
+    return refit
@@ -0,0 +1,59 @@
+import os
+import sys
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pytest
+
+# The app modules import each other as top-level modules.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "reloading"))
+
+# Tests that need PostgreSQL run against this database. It is dropped and
+# recreated, so it must look like a scratch database (or be opted in).
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+ALLOW_DROP = os.environ.get("TEST_DATABASE_ALLOW_DROP") == "1"
+
+
+def is_scratch_database(url):
+    name = urlparse(url).path.rsplit("/", 1)[-1].lower()
+    return "test" in name or "scratch" in name
+
+
+@pytest.fixture(scope="session")
+def pg_app():
+    if not DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    if not (ALLOW_DROP or is_scratch_database(DATABASE_URL)):
+        raise pytest.UsageError(
+            f"refusing to drop {DATABASE_URL}: the database name must contain "
+            "'test' or 'scratch', or set TEST_DATABASE_ALLOW_DROP=1"
+        )
+
+    # The engine is built when the app is imported.
+    os.environ["DATABASE_URL"] = DATABASE_URL
+    from app import app
+    from database import db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+@pytest.fixture()
+def pg_session(pg_app):
+    # Every test runs in a transaction that is rolled back afterwards.
+    from sqlalchemy.orm import Session
+
+    from database import db
+
+    with pg_app.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        session = Session(bind=connection, join_transaction_mode="create_savepoint")
+        try:
+            yield session
+        finally:
+            session.close()
+            transaction.rollback()
+            connection.close()
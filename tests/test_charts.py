@@ -0,0 +1,71 @@
+import base64
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from charts import (
+    CHART_TEMPLATE,
+    chart_payload,
+    load_performance_scatter,
+    velocity_scatter,
+)
+
+
+def decode(array):
+    raw = base64.b64decode(array["bdata"])
+    return np.frombuffer(raw, dtype=np.dtype(array["dtype"]).newbyteorder("<"))
+
+
+@pytest.fixture()
+def shots():
+    rng = np.random.default_rng(1)
+    charges = np.repeat([40.0, 40.5, 41.0], 4) + rng.normal(0, 1e-4, 12)
+    return pd.DataFrame(
+        {
+            "powder_weight_grains": charges,
+            "velocity_fps": 2600 + 60 * (charges - 40) + rng.normal(0, 8, 12),
+            "firearm_name": ["Rifle A", "Rifle B"] * 6,
+            "bullet_name": ["Bullet X", "Bullet Y", "Bullet Z"] * 4,
+            "full_name": ["Load 1"] * 12,
+        }
+    )
+
+
+def test_values_are_rounded_to_measurement_precision(shots):
+    payload = json.loads(chart_payload(velocity_scatter(shots)))
+    for trace in payload["data"]:
+        x, y = decode(trace["x"]), decode(trace["y"])
+        np.testing.assert_allclose(x, np.round(x.astype(float), 2), atol=1e-4)
+        np.testing.assert_allclose(y, np.round(y.astype(float), 1), atol=1e-3)
+        assert "%{x:.2f}" in trace["hovertemplate"]
+        assert "%{y:.1f}" in trace["hovertemplate"]
+
+    assert payload["layout"]["template"] == CHART_TEMPLATE
+
+
+def test_trendline_points_are_deduplicated(shots):
+    shots["powder_weight_grains"] = shots["powder_weight_grains"].round(1)
+    shots = shots.sort_values("powder_weight_grains")
+    fig = load_performance_scatter(shots, "Ladder")
+    payload = json.loads(chart_payload(fig))
+
+    markers, line = payload["data"]
+    assert line["mode"] == "lines"
+    assert len(decode(markers["x"])) == 12
+    np.testing.assert_allclose(decode(line["x"]), [40.0, 40.5, 41.0])
+
+
+def test_customdata_round_trips_through_lookups(shots):
+    fig = velocity_scatter(shots)
+    payload = json.loads(chart_payload(fig))
+
+    (bullets,) = payload["lookups"]
+    assert bullets == ["Bullet X", "Bullet Y", "Bullet Z"]
+    for trace, source in zip(payload["data"], fig.data):
+        assert "customdata" not in trace
+        (codes,) = trace["customcodes"]
+        assert codes["dtype"] == "u1"
+        labels = [bullets[i] for i in decode(codes)]
+        assert labels == list(np.asarray(source.customdata)[:, 0])
@@ -0,0 +1,80 @@
+import gzip
+
+import pytest
+from flask import Response
+
+import compression
+from compression import MIN_SIZE, compress_response
+
+BODY = "<p>" + "velocity " * MIN_SIZE + "</p>"
+
+
+def html(body=BODY, **kwargs):
+    return Response(body, mimetype="text/html", **kwargs)
+
+
+@pytest.mark.parametrize(
+    ("accept", "expected"),
+    [
+        ("gzip", "gzip"),
+        ("gzip, deflate, br", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("br;q=0, gzip", "gzip"),
+        ("br;q=0.0, gzip", "gzip"),
+        ("br; q=0.000, GZIP", "gzip"),
+        ("br;q=abc, gzip;q=0.1", "gzip"),
+        ("gzip;q=0", None),
+        ("*", "br"),
+        ("gzip;q=0.8, *;q=0.5", "gzip"),
+        ("br;q=0, *", "gzip"),
+        ("*;q=0", None),
+        ("*;q=0, gzip", "gzip"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiation(accept, expected):
+    assert compression._choose_encoding(accept) == expected
+
+
+def test_negotiation_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression._choose_encoding("br") is None
+    assert compression._choose_encoding("br, gzip;q=0.1") == "gzip"
+    assert compression._choose_encoding("*") == "gzip"
+
+
+def test_gzip_round_trip():
+    response = compress_response(html(), "gzip")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.vary
+    assert gzip.decompress(response.get_data()).decode() == BODY
+
+
+def test_brotli_round_trip():
+    brotli = pytest.importorskip("brotli")
+    response = compress_response(html(), "br")
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.get_data()).decode() == BODY
+
+
+def test_small_bodies_are_not_compressed():
+    response = compress_response(html("x" * (MIN_SIZE - 1)), "gzip")
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.vary
+
+
+@pytest.mark.parametrize("mimetype", ["image/png", "application/octet-stream"])
+def test_non_compressible_types_are_untouched(mimetype):
+    response = compress_response(Response(BODY, mimetype=mimetype), "gzip")
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" not in response.vary
+    assert response.get_data(as_text=True) == BODY
+
+
+def test_already_encoded_and_empty_responses_are_untouched():
+    encoded = html(headers={"Content-Encoding": "br"})
+    assert compress_response(encoded, "gzip").get_data(as_text=True) == BODY
+
+    not_modified = html(status=304)
+    assert "Content-Encoding" not in compress_response(not_modified, "gzip").headers
@@ -0,0 +1,144 @@
+from collections import namedtuple
+from itertools import count
+
+import numpy as np
+import pytest
+
+import ladder
+from ladder import (
+    MIN_RANKED_SHOTS,
+    analyze_shots,
+    clear_ladder_cache,
+    firearm_ladder_analysis,
+)
+
+Row = namedtuple(
+    "Row",
+    "load_id result_id bullet_id powder_id powder_weight_grains bullet_name "
+    "powder_name group_size_moa velocity_fps",
+)
+_result_ids = count(1)
+
+
+def string(load_id, charge, velocities, bullet_id=1, powder_id=1):
+    # One test result's worth of shots.
+    result_id = next(_result_ids)
+    return [
+        Row(
+            load_id,
+            result_id,
+            bullet_id,
+            powder_id,
+            charge,
+            f"B{bullet_id}",
+            f"P{powder_id}",
+            None,
+            v,
+        )
+        for v in velocities
+    ]
+
+
+@pytest.fixture()
+def ladder_rows():
+    # Velocity climbs ~60 fps/gr except for a flat spot between 41.0 and 41.5.
+    # Each charge is shot on two days, the second running 20 fps slower.
+    rng = np.random.default_rng(3)
+    means = {40.0: 2600, 40.5: 2630, 41.0: 2660, 41.5: 2665, 42.0: 2725}
+    rows = []
+    for load_id, (charge, mean) in enumerate(means.items(), start=1):
+        for shift in (0, -20):
+            velocities = mean + shift + rng.normal(0, load_id, size=5)
+            rows += string(load_id, charge, velocities)
+    return rows
+
+
+def test_empty():
+    assert analyze_shots([]) == {"loads": [], "ladders": []}
+
+
+def test_detects_flat_spot(ladder_rows):
+    (result,) = analyze_shots(ladder_rows)["ladders"]
+    assert result["ladder"] == "B1 / P1"
+    assert result["loads"] == 5
+    assert [(n["from_grains"], n["to_grains"]) for n in result["nodes"]] == [
+        (41.0, 41.5)
+    ]
+    assert result["nodes"][0]["center_grains"] == 41.25
+
+
+def test_ladders_need_three_charges(ladder_rows):
+    rows = ladder_rows + string(10, 40.0, [2600, 2610], bullet_id=2)
+    rows += string(11, 41.0, [2650, 2660], bullet_id=2)
+    ladders = analyze_shots(rows)["ladders"]
+    assert [lad["ladder"] for lad in ladders] == ["B1 / P1"]
+
+
+def test_sd_and_es_are_within_string():
+    first, second = [2700, 2710, 2705, 2695], [2650, 2660, 2655, 2645, 2652]
+    (load,) = analyze_shots(string(1, 40.0, first) + string(1, 40.0, second))["loads"]
+
+    ss = sum(((np.array(s) - np.mean(s)) ** 2).sum() for s in (first, second))
+    assert load["sd_fps"] == round(np.sqrt(ss / (3 + 4)), 1)
+    assert load["es_fps"] == (15 + 15) / 2
+    assert load["shots"] == 9
+    assert load["strings"] == 2
+    assert load["mean_fps"] == round(np.mean(first + second), 1)
+
+    low, high = load["sd_ci"]
+    assert low <= load["sd_fps"] <= high
+    assert high < 15  # the 50 fps shift between days is not in the interval
+    assert "es_ci" not in load
+
+
+def test_ranking_by_sd_interval_upper_bound():
+    rng = np.random.default_rng(5)
+    rows = string(1, 40.0, [2700, 2700.5])  # lucky pair
+    rows += string(2, 40.5, 2720 + rng.normal(0, 4, 15))
+    rows += string(2, 40.5, 2740 + rng.normal(0, 4, 15))
+    rows += string(3, 41.0, 2750 + rng.normal(0, 6, 10))
+    rows += string(4, 41.5, [2760]) + string(4, 41.5, [2770])
+    loads = analyze_shots(rows)["loads"]
+
+    assert [(load["load_id"], load["rank"]) for load in loads[:2]] == [(2, 1), (3, 2)]
+    uppers = [load["sd_ci"][1] for load in loads if load["rank"]]
+    assert uppers == sorted(uppers)
+
+    unranked = {load["load_id"]: load for load in loads[2:]}
+    assert set(unranked) == {1, 4}
+    assert all(load["rank"] is None for load in unranked.values())
+    assert unranked[1]["sd_fps"] is not None
+    assert unranked[1]["shots"] < MIN_RANKED_SHOTS
+
+    # Two single-shot strings give no within-string spread at all.
+    assert unranked[4]["sd_fps"] is None
+    assert unranked[4]["es_fps"] is None
+    assert unranked[4]["sd_ci"] == [None, None]
+
+
+def test_skips_shots_without_velocity_or_charge(ladder_rows):
+    rows = ladder_rows + string(20, None, [2700, 2710])
+    rows += [ladder_rows[0]._replace(velocity_fps=None)]
+    assert analyze_shots(rows) == analyze_shots(ladder_rows)
+
+
+def test_bootstrap_chunking_does_not_change_result(ladder_rows, monkeypatch):
+    expected = analyze_shots(ladder_rows)
+    monkeypatch.setattr(ladder, "BOOTSTRAP_MAX_CELLS", 7 * len(ladder_rows))
+    assert analyze_shots(ladder_rows) == expected
+
+
+def test_cache_tracks_shot_data(ladder_rows):
+    clear_ladder_cache()
+    first = firearm_ladder_analysis(1, ladder_rows)
+    assert firearm_ladder_analysis(1, list(ladder_rows)) is first
+
+    edited = [ladder_rows[0]._replace(velocity_fps=2500.0)] + ladder_rows[1:]
+    assert firearm_ladder_analysis(1, edited) is not first
+
+    recharged = [
+        r._replace(powder_weight_grains=39.5) if r.load_id == 1 else r
+        for r in ladder_rows
+    ]
+    assert firearm_ladder_analysis(1, recharged)["loads"] != first["loads"]
+    clear_ladder_cache()
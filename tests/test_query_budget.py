@@ -0,0 +1,283 @@
+"""Query budget regression tests.
+
+Seeds a scratch PostgreSQL database (TEST_DATABASE_URL, see conftest.py),
+requests every GET route and records the SQL each one emits. A route fails
+when it exceeds its query-count or rows-fetched budget, or when a query it
+runs against one of the large tables is planned as a sequential scan.
+
+Set QUERY_BUDGET_PLANS_DIR to keep the EXPLAIN plan of every large-table
+query for inspection.
+"""
+
+import json
+import os
+import random
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event, insert
+
+import database
+from database import Bullet, Cartridge, Firearm, Load, Powder, Shot, db
+from ladder import clear_ladder_cache
+
+PLANS_DIR = os.environ.get("QUERY_BUDGET_PLANS_DIR")
+
+# Seeded dataset. Budgets below are written against these sizes.
+FIREARMS = 50
+BULLETS = 12
+POWDERS = 10
+CARTRIDGES = 6
+LOADS = 300
+SESSIONS = 2500
+RESULTS_PER_SESSION = 8
+SHOTS_PER_RESULT = 10
+
+RESULTS = SESSIONS * RESULTS_PER_SESSION
+SHOTS = RESULTS * SHOTS_PER_RESULT
+RECENT_RESULTS = 50  # app.RECENT_RESULTS, rows in the dashboard table
+LARGE_TABLES = ("shots", "test_results")
+
+# endpoint -> (path, max queries, max rows fetched, tables that must not be
+# sequentially scanned). Every GET endpoint in the app needs an entry.
+ROUTE_BUDGETS = {
+    "index": (
+        "/",
+        5,
+        FIREARMS + BULLETS + POWDERS + RECENT_RESULTS + 10,
+        LARGE_TABLES,
+    ),
+    "list_firearms": ("/firearms", 1, FIREARMS, ()),
+    "add_firearm": ("/firearms/add", 0, 0, ()),
+    "edit_firearm": ("/firearms/edit/1", 1, 1, ()),
+    "firearm_detail": (
+        "/firearm/1",
+        3,
+        SHOTS // FIREARMS + SESSIONS // FIREARMS + 10,
+        LARGE_TABLES,
+    ),
+    "firearm_ladder_json": (
+        "/firearm/1/ladder.json",
+        2,
+        SHOTS // FIREARMS + 10,
+        LARGE_TABLES,
+    ),
+    "list_bullets": ("/bullets", 1, BULLETS, ()),
+    "add_bullet": ("/bullets/add", 0, 0, ()),
+    "edit_bullet": ("/bullets/edit/1", 1, 1, ()),
+    "bullet_detail": (
+        "/bullets/1",
+        3,
+        2 * (LOADS // BULLETS + RESULTS // BULLETS) + 10,
+        LARGE_TABLES,
+    ),
+    "list_powders": ("/powders", 1, POWDERS, ()),
+    "add_powder": ("/powders/add", 0, 0, ()),
+    "edit_powder": ("/powders/edit/1", 1, 1, ()),
+    "powder_detail": (
+        "/powders/1",
+        4,
+        2 * (LOADS // POWDERS + RESULTS // POWDERS) + 10,
+        LARGE_TABLES,
+    ),
+    "list_cartridges": ("/cartridges", 1, CARTRIDGES, ()),
+    "add_cartridge": ("/cartridges/add", 0, 0, ()),
+    "edit_cartridge": ("/cartridges/edit/1", 1, 1, ()),
+    "cartridge_detail": (
+        "/cartridges/1",
+        3,
+        2 * (LOADS // CARTRIDGES + RESULTS // CARTRIDGES) + 10,
+        LARGE_TABLES,
+    ),
+    "chart_templates": ("/charts/templates.js", 0, 0, ()),
+}
+# Queries that legitimately read a large table in full, with their own row
+# budget. They are left out of the route's row budget and seq-scan check,
+# so the rest of the route is still held to a tight budget.
+FULL_SCAN_QUERIES = {
+    # The dashboard chart plots every shot: a full scan of shots and
+    # test_results is the right plan for it.
+    "index": [(re.compile(r"^SELECT shots\.velocity_fps\b"), SHOTS)],
+}
+LARGE_TABLE = re.compile(r"\b(" + "|".join(LARGE_TABLES) + r")\b")
+
+
+def seed(rng):
+    def bulk(model, rows):
+        db.session.execute(insert(model), rows)
+
+    bulk(
+        Firearm,
+        [
+            {"make": f"Make {i}", "model": f"Model {i}", "caliber": 0.308}
+            for i in range(FIREARMS)
+        ],
+    )
+    bulk(
+        Bullet,
+        [
+            {"manufacturer": f"Bullet Co {i}", "model": f"B{i}", "weight_grains": 140}
+            for i in range(BULLETS)
+        ],
+    )
+    bulk(
+        Powder,
+        [{"manufacturer": f"Powder Co {i}", "name": f"P{i}"} for i in range(POWDERS)],
+    )
+    bulk(Cartridge, [{"name": f"Cartridge {i}"} for i in range(CARTRIDGES)])
+    bulk(
+        Load,
+        [
+            {
+                "cartridge_id": i % CARTRIDGES + 1,
+                "bullet_id": i % BULLETS + 1,
+                "powder_id": i % POWDERS + 1,
+                "powder_weight_grains": 38 + (i % 20) * 0.3,
+            }
+            for i in range(LOADS)
+        ],
+    )
+
+    start = datetime(2020, 1, 1)
+    bulk(
+        database.TestSession,
+        [
+            {
+                "firearm_id": i % FIREARMS + 1,
+                "test_date": start + timedelta(days=i),
+                "location": "Range",
+                "temperature_f": rng.randint(20, 100),
+            }
+            for i in range(SESSIONS)
+        ],
+    )
+    bulk(
+        database.TestResult,
+        [
+            {
+                "session_id": i // RESULTS_PER_SESSION + 1,
+                "load_id": rng.randint(1, LOADS),
+                "range_yrd": 100,
+                "group_size_moa": round(rng.uniform(0.3, 2.0), 3),
+                "muzzle_velocity_avg": 2700,
+                "shot_count": SHOTS_PER_RESULT,
+            }
+            for i in range(RESULTS)
+        ],
+    )
+    bulk(
+        Shot,
+        [
+            {
+                "result_id": i // SHOTS_PER_RESULT + 1,
+                "shot_number": i % SHOTS_PER_RESULT + 1,
+                "velocity_fps": round(rng.gauss(2700, 15), 2),
+            }
+            for i in range(SHOTS)
+        ],
+    )
+    db.session.commit()
+
+
+def seq_scans(plan, tables):
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child, tables))
+    return found
+
+
+def explain(statement, parameters):
+    with db.engine.connect() as conn:
+        result = conn.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters or None
+        )
+        return result.scalar()[0]["Plan"]
+
+
+def run_route(app, path):
+    queries = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        queries.append({"statement": statement, "parameters": parameters, "rows": 0})
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        queries[-1]["rows"] = max(cursor.rowcount, 0) if cursor.description else 0
+
+    event.listen(db.engine, "before_cursor_execute", before)
+    event.listen(db.engine, "after_cursor_execute", after)
+    try:
+        response = app.test_client().get(path)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before)
+        event.remove(db.engine, "after_cursor_execute", after)
+    return response.status_code, queries
+
+
+@pytest.fixture(scope="session")
+def seeded_app(pg_app):
+    with pg_app.app_context():
+        # Budgets refer to rows by id, so start from fresh sequences.
+        db.drop_all()
+        db.create_all()
+        seed(random.Random(0))
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+    return pg_app
+
+
+def test_every_get_route_has_a_budget(pg_app):
+    endpoints = {
+        rule.endpoint
+        for rule in pg_app.url_map.iter_rules()
+        if "GET" in rule.methods and rule.endpoint != "static"
+    }
+    assert sorted(endpoints - set(ROUTE_BUDGETS)) == []
+
+
+@pytest.mark.parametrize("endpoint", ROUTE_BUDGETS)
+def test_route_within_budget(seeded_app, endpoint):
+    path, max_queries, max_rows, no_seq_scan = ROUTE_BUDGETS[endpoint]
+    with seeded_app.app_context():
+        clear_ladder_cache()
+        db.session.remove()
+        status, queries = run_route(seeded_app, path)
+
+        full_scans = FULL_SCAN_QUERIES.get(endpoint, [])
+        checked, scans = [], []
+        for i, query in enumerate(queries):
+            exempt = [b for p, b in full_scans if p.search(query["statement"])]
+            if exempt:
+                assert query["rows"] <= exempt[0], query["statement"]
+                continue
+            checked.append(query)
+            if not LARGE_TABLE.search(query["statement"]):
+                continue
+            plan = explain(query["statement"], query["parameters"])
+            if PLANS_DIR:
+                plans = Path(PLANS_DIR)
+                plans.mkdir(parents=True, exist_ok=True)
+                (plans / f"{endpoint}.{i}.json").write_text(
+                    json.dumps(
+                        {"statement": query["statement"], "plan": plan}, indent=2
+                    )
+                )
+            scans.extend(seq_scans(plan, no_seq_scan))
+
+    rows = sum(q["rows"] for q in checked)
+    statements = "\n".join(q["statement"] for q in queries)
+    assert status == 200
+    assert len(queries) <= max_queries, f"{len(queries)} queries:\n{statements}"
+    assert rows <= max_rows, f"{rows} rows fetched:\n{statements}"
+    assert sorted(set(scans)) == [], "sequential scan on a large table"
+
+
+def test_create_indexes_is_idempotent(seeded_app):
+    runner = seeded_app.test_cli_runner()
+    for _ in range(2):
+        result = runner.invoke(args=["create-indexes"])
+        assert result.exit_code == 0, result.output
+        assert "ix_shots_result_id on shots" in result.output
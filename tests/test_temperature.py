@@ -0,0 +1,237 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from sqlalchemy import delete, insert, select, update
+
+import database
+from database import Load, LoadTemperatureStats, Shot
+from temperature import (
+    _aggregate_select,
+    add_observation,
+    load_slope,
+    pooled_slope,
+    predict_velocity,
+)
+
+
+def empty_stats():
+    return SimpleNamespace(
+        n=0, mean_temp_f=0.0, mean_velocity_fps=0.0, m2_temp=0.0, c_temp_velocity=0.0
+    )
+
+
+@pytest.fixture()
+def observations():
+    # Three loads with different baselines sharing a -1.2 fps/°F response.
+    rng = np.random.default_rng(7)
+    data = {}
+    for load_id, baseline in enumerate((2650.0, 2700.0, 2800.0)):
+        temps = rng.uniform(20, 100, size=40)
+        velocities = baseline - 1.2 * temps + rng.normal(0, 5, size=40)
+        data[load_id] = (temps, velocities)
+    return data
+
+
+def test_add_observation_matches_batch_moments(observations):
+    for temps, velocities in observations.values():
+        stats = empty_stats()
+        for t, v in zip(temps, velocities):
+            add_observation(stats, t, v)
+
+        assert stats.n == len(temps)
+        assert stats.mean_temp_f == pytest.approx(temps.mean())
+        assert stats.mean_velocity_fps == pytest.approx(velocities.mean())
+        assert stats.m2_temp == pytest.approx(temps.var() * len(temps))
+        assert stats.c_temp_velocity == pytest.approx(
+            np.cov(temps, velocities, bias=True)[0, 1] * len(temps)
+        )
+        assert load_slope(stats) == pytest.approx(np.polyfit(temps, velocities, 1)[0])
+
+
+def test_pooled_slope_matches_within_load_least_squares(observations):
+    all_stats = []
+    for temps, velocities in observations.values():
+        stats = empty_stats()
+        for t, v in zip(temps, velocities):
+            add_observation(stats, t, v)
+        all_stats.append(stats)
+
+    # Least squares with one intercept per load and a shared slope.
+    n = sum(len(t) for t, _ in observations.values())
+    design = np.zeros((n, len(observations) + 1))
+    target = np.zeros(n)
+    row = 0
+    for k, (temps, velocities) in enumerate(observations.values()):
+        design[row : row + len(temps), k] = 1
+        design[row : row + len(temps), -1] = temps
+        target[row : row + len(temps)] = velocities
+        row += len(temps)
+    coef = np.linalg.lstsq(design, target, rcond=None)[0]
+
+    slope = pooled_slope(all_stats)
+    assert slope == pytest.approx(coef[-1])
+    assert slope == pytest.approx(-1.2, abs=0.1)
+
+    temps, velocities = observations[0]
+    assert predict_velocity(all_stats[0], 40, slope) == pytest.approx(
+        coef[0] + coef[-1] * 40, abs=5
+    )
+
+
+def test_predict_velocity_falls_back_to_powder_slope():
+    stats = empty_stats()
+    for v in (2700, 2710, 2690):
+        add_observation(stats, 60, v)
+
+    assert load_slope(stats) is None
+    assert predict_velocity(stats, 30) is None
+    assert predict_velocity(stats, 30, fallback_slope=-1.0) == pytest.approx(2730)
+    assert predict_velocity(empty_stats(), 30, fallback_slope=-1.0) is None
+    assert pooled_slope([stats]) is None
+
+
+# --- Stored statistics (PostgreSQL) ---
+
+
+def make_load(session, charge=40.0):
+    load = Load(powder_weight_grains=charge)
+    session.add(load)
+    return load
+
+
+def make_result(session, load, temperature_f, velocities):
+    test_session = database.TestSession(
+        test_date=datetime(2024, 1, 1), temperature_f=temperature_f
+    )
+    result = database.TestResult(test_session=test_session, load=load)
+    result.shots = [
+        Shot(shot_number=i, velocity_fps=v) for i, v in enumerate(velocities, 1)
+    ]
+    session.add(result)
+    return result
+
+
+def stored(session, load):
+    return session.execute(
+        select(LoadTemperatureStats)
+        .where(LoadTemperatureStats.load_id == load.load_id)
+        .execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+
+
+def assert_matches_refit(session, *loads):
+    session.flush()
+    for load in loads:
+        expected = session.execute(_aggregate_select([load.load_id])).one_or_none()
+        stats = stored(session, load)
+        if expected is None:
+            assert stats is None
+            continue
+        _, n, mean_temp, mean_velocity, m2, cov = expected
+        assert stats.n == n
+        assert stats.mean_temp_f == pytest.approx(float(mean_temp))
+        assert stats.mean_velocity_fps == pytest.approx(float(mean_velocity))
+        assert stats.m2_temp == pytest.approx(float(m2), abs=1e-6)
+        assert stats.c_temp_velocity == pytest.approx(float(cov), abs=1e-6)
+
+
+def test_new_shots_are_merged_across_flushes(pg_session):
+    load = make_load(pg_session)
+    make_result(pg_session, load, 40, [2750, 2755, 2748])
+    pg_session.flush()
+    assert stored(pg_session, load).n == 3
+
+    make_result(pg_session, load, 90, [2700, 2695])
+    make_result(pg_session, load, 65, [2722])
+    assert_matches_refit(pg_session, load)
+    assert stored(pg_session, load).n == 6
+
+
+def test_deleted_and_edited_shots_are_recomputed(pg_session):
+    load = make_load(pg_session)
+    cold = make_result(pg_session, load, 30, [2760, 2765, 2770])
+    make_result(pg_session, load, 90, [2690, 2700])
+    pg_session.flush()
+
+    pg_session.delete(cold.shots[0])
+    assert_matches_refit(pg_session, load)
+    assert stored(pg_session, load).n == 4
+
+    cold.shots[1].velocity_fps = 2800
+    assert_matches_refit(pg_session, load)
+
+
+def test_session_temperature_edit_is_recomputed(pg_session):
+    load = make_load(pg_session)
+    result = make_result(pg_session, load, 30, [2760, 2765])
+    make_result(pg_session, load, 90, [2690, 2700])
+    pg_session.flush()
+
+    result.test_session.temperature_f = 50
+    assert_matches_refit(pg_session, load)
+    assert stored(pg_session, load).mean_temp_f == pytest.approx(70)
+
+
+def test_deleted_session_is_recomputed(pg_session):
+    load = make_load(pg_session)
+    result = make_result(pg_session, load, 30, [2760, 2765])
+    make_result(pg_session, load, 90, [2690, 2700, 2695])
+    pg_session.flush()
+
+    pg_session.delete(result.test_session)
+    assert_matches_refit(pg_session, load)
+    assert stored(pg_session, load).n == 3
+
+
+def test_deleted_load_drops_its_stats(pg_session):
+    load, other = make_load(pg_session, 40.0), make_load(pg_session, 41.0)
+    make_result(pg_session, load, 30, [2760, 2765])
+    make_result(pg_session, other, 60, [2740])
+    pg_session.flush()
+    load_id = load.load_id
+
+    pg_session.delete(load)
+    pg_session.flush()
+    assert pg_session.get(LoadTemperatureStats, load_id) is None
+    assert_matches_refit(pg_session, other)
+
+
+def test_result_moved_to_another_load(pg_session):
+    first, second = make_load(pg_session, 40.0), make_load(pg_session, 41.0)
+    moved = make_result(pg_session, first, 30, [2760, 2765])
+    make_result(pg_session, first, 90, [2690, 2700])
+    make_result(pg_session, second, 60, [2740])
+    pg_session.flush()
+
+    moved.load = second
+    assert_matches_refit(pg_session, first, second)
+    assert stored(pg_session, second).n == 3
+
+    pg_session.delete(moved.shots[0])
+    pg_session.delete(moved.shots[1])
+    pg_session.delete(moved)
+    assert_matches_refit(pg_session, first, second)
+    assert stored(pg_session, second).n == 1
+
+
+def test_bulk_writes_are_recomputed(pg_session):
+    load = make_load(pg_session)
+    result = make_result(pg_session, load, 70, [2720])
+    pg_session.flush()
+
+    pg_session.execute(
+        insert(Shot),
+        [{"result_id": result.result_id, "velocity_fps": v} for v in (2725, 2730)],
+    )
+    assert_matches_refit(pg_session, load)
+    assert stored(pg_session, load).n == 3
+
+    pg_session.execute(
+        update(Shot).where(Shot.result_id == result.result_id).values(velocity_fps=2700)
+    )
+    assert_matches_refit(pg_session, load)
+
+    pg_session.execute(delete(Shot).where(Shot.result_id == result.result_id))
+    assert_matches_refit(pg_session, load)